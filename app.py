@@ -1,27 +1,46 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import os
 import io
+import csv
+import glob
+import hashlib
+import hmac
 import time
 import shutil
 from contextlib import contextmanager
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # ================== 基础配置 ==================
 DATA_FILE = "signup_data.csv"
-EXCEL_FILE = "signup_data.xlsx"
 ADMIN_PASSWORD = "52739"
 
 TZ = ZoneInfo("Asia/Shanghai")  # ✅ 统一中国时区
 
+# 报名表 / 编辑表共用的选项；*_IDX 用于 O(1) 反查默认选中项
+TOWNHALL_OPTIONS = ["18本", "17本", "16本", "16本以下"]
+FILL_OPTIONS = ["补位 (服从安排)", "不补位 (必须首发)"]
+TOWNHALL_IDX = {v: i for i, v in enumerate(TOWNHALL_OPTIONS)}
+FILL_IDX = {v: i for i, v in enumerate(FILL_OPTIONS)}
+
 # 管理员强制关闭报名开关（创建文件=关闭）
 FORCE_CLOSE_FILE = "force_close.flag"
 
-# 简易文件锁（防并发写）
+# 已发放的最大 ID（追加写入时不必为一个整数解析整个 CSV）
+MAXID_FILE = "signup_data.maxid"
+
+# 写入锁文件（防并发写）
 LOCK_FILE = "signup_data.lock"
 
-# 每次启动自动备份（可按需关掉）
+# 自动备份（每天最多一份，数据没变不备份；可按需关掉）
 ENABLE_AUTO_BACKUP = True
 
 
@@ -40,6 +59,23 @@ def normalize_name(name: str) -> str:
     return name
 
 
+@st.cache_resource(show_spinner=False)
+def _admin_digest() -> bytes:
+    return hashlib.sha256(ADMIN_PASSWORD.encode("utf-8")).digest()
+
+
+def is_admin(pwd: str) -> bool:
+    """管理员密码校验：摘要只算一次，比较用常量时间"""
+    if not pwd:
+        return False
+    return hmac.compare_digest(hashlib.sha256(pwd.encode("utf-8")).digest(), _admin_digest())
+
+
+def normalize_series(s: pd.Series) -> pd.Series:
+    """normalize_name 的向量化版本：整列在 pandas 内完成，不逐行调用 Python 函数"""
+    return s.astype("string").fillna("").str.strip().str.replace(r"\s+", " ", regex=True)
+
+
 def format_countdown(td: timedelta) -> str:
     total = max(0, int(td.total_seconds()))
     d = total // 86400
@@ -48,58 +84,90 @@ def format_countdown(td: timedelta) -> str:
     return f"{d} 天 {h} 小时 {m} 分钟"
 
 
+def _latest_backup() -> str | None:
+    backups = glob.glob("signup_data_backup_*.csv")
+    return max(backups, key=os.path.getmtime) if backups else None
+
+
+@st.cache_resource(show_spinner=False)
+def _backup_once_per_day(day: str) -> str | None:
+    """
+    每天（每个进程）只在当天第一次 rerun 时执行一次；数据自上次备份后没变就跳过。
+    copy2 保留源文件 mtime，因此“备份 mtime >= 数据 mtime”即表示没有新改动。
+    不用 os.link 硬链接：add_entry 是原地追加，会同时改掉链接出去的“备份”。
+    """
+    latest = _latest_backup()
+    if latest and os.path.getmtime(latest) >= os.path.getmtime(DATA_FILE):
+        return None
+    backup_name = f"signup_data_backup_{day}.csv"
+    shutil.copy2(DATA_FILE, backup_name)
+    return backup_name
+
+
 def auto_backup():
-    """启动时自动备份 CSV，避免误操作/升级导致数据风险"""
+    """自动备份 CSV（每天最多一份，且仅在数据有变化时），避免误操作/升级导致数据风险"""
     if not ENABLE_AUTO_BACKUP:
         return
     if os.path.exists(DATA_FILE):
-        ts = now_cn().strftime("%Y-%m-%d_%H-%M-%S")
-        backup_name = f"signup_data_backup_{ts}.csv"
         try:
-            shutil.copy(DATA_FILE, backup_name)
+            _backup_once_per_day(now_cn().strftime("%Y-%m-%d"))
         except Exception:
             # 备份失败不影响主流程
             pass
 
 
+def _try_lock(f):
+    """非阻塞加排他锁；拿不到时抛 OSError（POSIX 上是 BlockingIOError）"""
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
 @contextmanager
 def file_lock(timeout_seconds: int = 8):
     """
-    简易文件锁：通过创建 LOCK_FILE 实现互斥。
-    Streamlit Cloud 多用户同时提交时能显著降低写入冲突概率。
+    写入锁：对 LOCK_FILE 加系统级排他锁（POSIX 用 fcntl.flock，Windows 用 msvcrt.locking），
+    进程退出时由系统自动释放，不会因崩溃残留死锁。
+    锁的是独立的锁文件而不是 CSV 本身，因为 _replace_data_file 会用 os.replace 换掉 CSV。
+    Streamlit 的各会话是同一进程内的线程，两种锁都按打开的文件句柄区分持有者，线程间同样互斥。
     """
-    start = time.time()
-    while True:
-        try:
-            # O_EXCL: 若文件存在则报错，达到互斥目的
-            fd = os.open(LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-            os.close(fd)
-            break
-        except FileExistsError:
-            if time.time() - start > timeout_seconds:
-                raise TimeoutError("系统繁忙：请稍后再试（写入锁超时）")
-            time.sleep(0.12)
+    with open(LOCK_FILE, "a+") as f:
+        start = time.time()
+        while True:
+            try:
+                _try_lock(f)
+                break
+            except OSError:
+                if time.time() - start > timeout_seconds:
+                    raise TimeoutError("系统繁忙：请稍后再试（写入锁超时）")
+                time.sleep(0.02)
 
-    try:
-        yield
-    finally:
         try:
-            os.remove(LOCK_FILE)
-        except Exception:
-            pass
+            yield
+        finally:
+            _unlock(f)
 
 
 # ================== 时间窗口逻辑 ==================
-def get_signup_window(now: datetime | None = None):
+@st.cache_resource(show_spinner=False)
+def _signup_window_for_day(y: int, m: int, d: int) -> tuple[datetime, datetime]:
     """
     每轮：当月20日 00:00:00 → 次月2日 23:59:59
     自动处理跨月 / 跨年
-    """
-    if now is None:
-        now = now_cn()
-
-    y, m, d = now.year, now.month, now.day
 
+    按日期缓存：同一天内的所有 rerun 共用一份边界，
+    用 cache_resource 而不是 lru_cache，因为脚本每次 rerun 都会重新定义函数。
+    """
     if d >= 20:
         start = datetime(y, m, 20, 0, 0, 0, tzinfo=TZ)
         if m == 12:
@@ -116,6 +184,19 @@ def get_signup_window(now: datetime | None = None):
     return start, end
 
 
+@st.cache_resource(show_spinner=False)
+def _signup_window_ts(y: int, m: int, d: int) -> tuple[int, int]:
+    """同上，返回整数时间戳 (start_ts, end_ts)，开放判断只做整数比较"""
+    start, end = _signup_window_for_day(y, m, d)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def get_signup_window(now: datetime | None = None):
+    if now is None:
+        now = now_cn()
+    return _signup_window_for_day(now.year, now.month, now.day)
+
+
 def get_next_signup_start(now: datetime | None = None):
     if now is None:
         now = now_cn()
@@ -129,17 +210,27 @@ def get_next_signup_start(now: datetime | None = None):
     return datetime(now.year, now.month + 1, 20, 0, 0, 0, tzinfo=TZ)
 
 
-def is_signup_open() -> bool:
+def is_signup_open(now: datetime | None = None) -> bool:
     if os.path.exists(FORCE_CLOSE_FILE):
         return False
-    now = now_cn()
-    start, end = get_signup_window(now)
-    return start <= now <= end
+    if now is None:
+        now = now_cn()
+    start_ts, end_ts = _signup_window_ts(now.year, now.month, now.day)
+    return start_ts <= int(now.timestamp()) <= end_ts
 
 
 # ================== 数据层（更稳） ==================
 COLUMNS = ["ID", "提交时间", "游戏名字", "大本营等级", "是否接受补位"]
 
+# 显式列类型：C 解析器跳过类型推断；两个筛选列用 category，isin/unique 只看类别表
+# 提交时间保持原字符串（追加写入、原样展示/导出），需要比较时再按固定格式解析
+CSV_DTYPES = {
+    "提交时间": str,
+    "游戏名字": "string",
+    "大本营等级": "category",
+    "是否接受补位": "category",
+}
+
 
 def ensure_schema(df: pd.DataFrame) -> pd.DataFrame:
     """保证列齐全 + ID 合法"""
@@ -148,37 +239,127 @@ def ensure_schema(df: pd.DataFrame) -> pd.DataFrame:
         if c not in df.columns:
             df[c] = ""
 
-    # ID
-    if "ID" not in df.columns or df["ID"].isna().all():
-        df.insert(0, "ID", range(1, len(df) + 1))
-    df["ID"] = pd.to_numeric(df["ID"], errors="coerce").fillna(0).astype(int)
+    # ID（读入时已是整数列就不再做 to_numeric 全列扫描）
+    if df["ID"].isna().all():
+        df["ID"] = range(1, len(df) + 1)
+    if not pd.api.types.is_integer_dtype(df["ID"]):
+        df["ID"] = pd.to_numeric(df["ID"], errors="coerce").fillna(0).astype(int)
+
+    # 筛选列统一为固定类别的 category：表单选项在前（顺序即显示顺序），
+    # 历史数据里的其他取值追加在后，避免被转成 NaN 而在下次保存时丢失
+    for c, options in (("大本营等级", TOWNHALL_OPTIONS), ("是否接受补位", FILL_OPTIONS)):
+        col = df[c]
+        seen = col.cat.categories if isinstance(col.dtype, pd.CategoricalDtype) else col.dropna().unique()
+        extras = sorted((v for v in seen if v not in options), key=str)
+        categories = options + extras
+        if not isinstance(col.dtype, pd.CategoricalDtype):
+            df[c] = col.astype(pd.CategoricalDtype(categories))
+        elif col.cat.categories.tolist() != categories:
+            # 无序 CategoricalDtype 比较时忽略顺序，必须逐项比对类别表；set_categories 按值重排
+            df[c] = col.cat.set_categories(categories)
 
     # 保证列顺序
     df = df[COLUMNS]
     return df
 
 
-def load_data() -> pd.DataFrame:
-    if os.path.exists(DATA_FILE):
+def data_version() -> tuple[int, int]:
+    """
+    CSV 的 (mtime_ns, size)，作为各缓存的键：文件没变就不重新解析。
+    只需一次 os.stat；文件不存在时返回 (0, 0)。
+    """
+    try:
+        stat = os.stat(DATA_FILE)
+    except FileNotFoundError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def read_signup_csv(path: str) -> pd.DataFrame:
+    """
+    优先用 pyarrow 引擎（多线程 C++ 解析；pyarrow 是 streamlit 自带依赖），
+    没装时退回 pandas 的 C 引擎。数据文件按纯 UTF-8 存储；
+    旧版本写入的 BOM 两个引擎都会自行跳过，不必再用 utf-8-sig 解码。
+    """
+    try:
+        return pd.read_csv(path, dtype=CSV_DTYPES, engine="pyarrow", encoding="utf-8")
+    except ImportError:
+        return pd.read_csv(path, dtype=CSV_DTYPES, engine="c", encoding="utf-8")
+
+
+class _VersionChanged(Exception):
+    """读取期间 CSV 被改写：读到的内容不属于请求的版本，不能以该版本写入缓存"""
+
+
+@st.cache_data(show_spinner=False)
+def _load_cached(version: tuple[int, int]) -> pd.DataFrame:
+    """按文件版本缓存的读取：每次 rerun 不再重复 read_csv + ensure_schema"""
+    try:
+        df = read_signup_csv(DATA_FILE)
+    except Exception:
+        # CSV 读坏了也不至于崩：给空表
+        df = pd.DataFrame(columns=COLUMNS)
+    if data_version() != version:
+        raise _VersionChanged
+    return ensure_schema(df)
+
+
+def load_snapshot() -> tuple[tuple[int, int], pd.DataFrame]:
+    """
+    返回 (文件版本, 数据)，二者保证对应。同一区块里的派生缓存（搜索、导出、按 ID 取行等）
+    都用这一个版本和这一份数据，避免两次 os.stat 之间有人报名导致行数/行号对不上。
+    """
+    while True:
+        version = data_version()
+        if version == (0, 0):
+            return version, pd.DataFrame(columns=COLUMNS)
         try:
-            df = pd.read_csv(DATA_FILE)
-        except Exception:
-            # CSV 读坏了也不至于崩：给空表
-            df = pd.DataFrame(columns=COLUMNS)
-        return ensure_schema(df)
-    return pd.DataFrame(columns=COLUMNS)
+            return version, _load_cached(version)
+        except _VersionChanged:
+            continue
+
+
+def load_data() -> pd.DataFrame:
+    return load_snapshot()[1]
+
+
+def _csv_payload(df: pd.DataFrame) -> bytes:
+    return ensure_schema(df).to_csv(index=False).encode("utf-8")
+
+
+def _replace_data_file(payload: bytes):
+    """须在 file_lock 内调用：写临时文件再原子替换，写到一半中断也不会留下损坏的 CSV"""
+    tmp = DATA_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        # 先落盘再改名：否则断电后改名可能已生效而内容还没写入，得到空文件
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, DATA_FILE)
+    # 管理员改名/删除后轮次索引已过期，删掉等下次查重时重建
+    _drop_round_indexes()
+    # Excel 不再随每次写入生成，只在管理员点击下载时按需导出
+
+
+def _clear_data_caches():
+    # 写完立即失效缓存（不依赖文件时间戳精度）
+    _load_cached.clear()
+    current_round_names.clear()
 
 
-def save_full_data(df: pd.DataFrame):
-    df = ensure_schema(df)
-    # 用锁避免并发写冲突
+def commit_pending_ops(ops: list[tuple[str, int, dict]]):
+    """
+    管理员暂存修改一次落盘。锁外基于快照应用修改并序列化；进锁后确认 CSV 仍是该版本，
+    若期间有人报名（版本变了），就在锁内基于最新数据重新应用一遍，新报名不会被整表覆盖吞掉。
+    """
+    version, df = load_snapshot()
+    payload = _csv_payload(apply_pending_ops(df, ops))
     with file_lock():
-        df.to_csv(DATA_FILE, index=False, encoding="utf-8-sig")
-        # Excel 失败不影响 CSV 主存储
-        try:
-            df.to_excel(EXCEL_FILE, index=False)
-        except Exception:
-            pass
+        if data_version() != version:
+            _, df = load_snapshot()
+            payload = _csv_payload(apply_pending_ops(df, ops))
+        _replace_data_file(payload)
+    _clear_data_caches()
 
 
 def parse_submit_time_series(df: pd.DataFrame) -> pd.Series:
@@ -186,17 +367,245 @@ def parse_submit_time_series(df: pd.DataFrame) -> pd.Series:
     将“提交时间”解析成带时区的 Series，用于比较当前轮次。
     旧数据通常是无时区字符串，所以要 tz_localize。
     """
-    s = pd.to_datetime(df["提交时间"], errors="coerce")
+    # create_entry 固定写成该格式：指定 format 走快速路径，不再逐个推断格式
+    s = pd.to_datetime(df["提交时间"], format="%Y-%m-%d %H:%M:%S", errors="coerce", cache=True)
     # s 是 datetime64[ns]（naive），补上海时区
     return s.dt.tz_localize("Asia/Shanghai", nonexistent="shift_forward", ambiguous="NaT")
 
 
+@st.cache_data(show_spinner=False, max_entries=1)
+def submit_times(version: tuple[int, int], _df: pd.DataFrame) -> pd.Series:
+    """
+    快照数据对应的带时区提交时间，每个文件版本只解析一次。
+    _df 须是 load_snapshot() 里与 version 配对的那份数据（下划线参数不参与缓存键）。
+    """
+    return parse_submit_time_series(_df)
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def records_by_id(version: tuple[int, int], _df: pd.DataFrame) -> dict[int, dict]:
+    """
+    ID → 整行记录（重复 ID 取第一条），供管理员编辑表单 O(1) 取行。
+    用 cache_resource 返回同一个 dict，避免 cache_data 每次反序列化整表；调用方只读不改。
+    """
+    records = {}
+    for rec in _df.to_dict("records"):
+        records.setdefault(int(rec["ID"]), rec)
+    return records
+
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def lower_names(version: tuple[int, int], _df: pd.DataFrame) -> np.ndarray:
+    """
+    全部名字的小写 numpy 字符串数组，下标与快照数据的行位置一致，
+    搜索时每次按键只做一次向量化子串查找。
+    """
+    return _df["游戏名字"].astype(str).str.lower().to_numpy(dtype=str)
+
+
+def load_data_window(start_iso: str, end_iso: str, chunksize: int = 20_000) -> pd.DataFrame:
+    """
+    只取提交时间在 [start_iso, end_iso] 内的行：分块读 CSV、逐块过滤，
+    峰值内存与本轮行数成正比，而不是与全部历史成正比。
+    提交时间由 create_entry 固定写成 "%Y-%m-%d %H:%M:%S"，字典序即时间序，
+    直接做字符串区间比较，不必走 to_datetime + tz_localize。
+    读取/解析错误直接抛给调用方：查重索引不能把“读坏了”当成“本轮没人报名”。
+    """
+    if not os.path.exists(DATA_FILE):
+        return pd.DataFrame(columns=COLUMNS)
+    parts = []
+    # 用 with 关闭分块读取器：提前 return 时也要释放 CSV 句柄，否则之后的 os.replace 在 Windows 上会失败
+    with pd.read_csv(DATA_FILE, dtype=CSV_DTYPES, engine="c", encoding="utf-8", chunksize=chunksize) as reader:
+        for chunk in reader:
+            if "提交时间" not in chunk.columns:
+                # 没有提交时间列的旧表：没有任何一行能落在本轮
+                return pd.DataFrame(columns=COLUMNS)
+            ts = chunk["提交时间"].fillna("").astype(str).to_numpy()
+            parts.append(chunk[(ts >= start_iso) & (ts <= end_iso)])
+    if not parts:
+        return pd.DataFrame(columns=COLUMNS)
+    return ensure_schema(pd.concat(parts, ignore_index=True))
+
+
+@st.cache_data(show_spinner=False)
+def current_round_names(version: tuple[int, int], start_iso: str, end_iso: str) -> frozenset[str]:
+    """
+    本轮（start_iso ~ end_iso）已报名的规范化名字集合，直接从 CSV 统计。
+    按文件版本 + 轮次缓存；提交路径走 load_round_names，这里只用于重建索引。
+    """
+    df = load_data_window(start_iso, end_iso)
+    # 用规范化名字做比对，减少空格/大小写导致的“重复漏洞”
+    return frozenset(normalize_series(df["游戏名字"]))
+
+
+def _issue_next_id() -> int:
+    """
+    从 MAXID_FILE 取下一个 ID 并立即写回（须在 file_lock 内调用）。
+    计数文件缺失或损坏时才扫描一次 CSV 取 max(ID)。
+    先写计数再追加数据：中途崩溃最多留下一个空号，不会出现重复 ID。
+    """
+    try:
+        with open(MAXID_FILE, encoding="utf-8") as f:
+            last = int(f.read().strip())
+    except (OSError, ValueError):
+        df = load_data()
+        last = int(df["ID"].max()) if not df.empty else 0
+    next_id = last + 1
+    with open(MAXID_FILE, "w", encoding="utf-8") as f:
+        f.write(str(next_id))
+    return next_id
+
+
+def round_index_path(start: datetime) -> str:
+    """本轮名字索引文件，按轮次开始月份命名"""
+    return f"round_{start:%Y%m}.idx"
+
+
+def _drop_round_indexes(keep: str | None = None):
+    for path in glob.glob("round_*.idx"):
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _read_round_index(path: str) -> tuple[tuple[int, int] | None, set[str]]:
+    """
+    读取轮次索引：首行是索引对应的 CSV data_version()（"mtime_ns size"），其后每行一个名字。
+    文件不存在或首行不是版本号（损坏 / 旧格式）时版本返回 None。
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            mtime_ns, size = map(int, f.readline().split())
+            return (mtime_ns, size), {line.rstrip("\n") for line in f}
+    except (FileNotFoundError, ValueError):
+        return None, set()
+
+
+def _write_round_index(path: str, version: tuple[int, int], names) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(f"{version[0]} {version[1]}\n")
+        f.writelines(n + "\n" for n in names)
+    os.replace(tmp, path)
+
+
+def load_round_names(start: datetime, end: datetime) -> set[str]:
+    """
+    本轮已报名的规范化名字集合，读自 round_<YYYYMM>.idx。
+    索引记录的 CSV 版本与当前文件不一致（新一轮 / 升级后首次 / 管理员保存 / 恢复备份 / 手工改表）
+    时在锁内从 CSV 重建，顺带清理旧轮次的索引文件。
+    CSV 读取失败时异常直接抛出，不写索引。
+    """
+    path = round_index_path(start)
+    version, names = _read_round_index(path)
+    if version is not None and version == data_version():
+        return names
+
+    with file_lock():
+        current = data_version()
+        # 等锁期间可能已被其他会话重建
+        version, names = _read_round_index(path)
+        if version == current:
+            return names
+        names = current_round_names(
+            current,
+            start.strftime("%Y-%m-%d %H:%M:%S"),
+            end.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        _write_round_index(path, current, names)
+        _drop_round_indexes(keep=path)
+    return set(names)
+
+
+def _append_round_index(before: tuple[int, int], name: str) -> None:
+    """
+    须在 file_lock 内、追加 CSV 之后调用。索引与追加前的 CSV 版本一致时补上新名字并记录新版本；
+    不一致（或没有索引）就不动它，留给 load_round_names 按版本重建。
+    """
+    path = round_index_path(get_signup_window()[0])
+    version, names = _read_round_index(path)
+    if version is None or version != before:
+        return
+    names.add(name)
+    _write_round_index(path, data_version(), names)
+
+
 def add_entry(entry: dict):
-    df = load_data()
-    next_id = df["ID"].max() + 1 if not df.empty else 1
-    entry = {**entry, "ID": int(next_id)}
-    df = pd.concat([df, pd.DataFrame([entry])], ignore_index=True)
-    save_full_data(df)
+    """
+    追加一行到 CSV（O(1) 写入），不再整表读出 + concat + 全量重写。
+    新文件或空文件先写表头；存储用纯 UTF-8，BOM 只加在给 Excel 用的下载文件上。
+    """
+    with file_lock():
+        before = data_version()
+        entry = {**entry, "ID": _issue_next_id()}
+
+        # 文件不存在或为空（旧版中断写入可能留下 0 字节文件）都要先写表头
+        write_header = before[1] == 0
+        with open(DATA_FILE, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS, restval="", extrasaction="ignore")
+            if write_header:
+                writer.writeheader()
+            writer.writerow(entry)
+
+        _append_round_index(before, normalize_name(entry["游戏名字"]))
+    _clear_data_caches()
+
+
+def apply_pending_ops(df: pd.DataFrame, ops: list[tuple[str, int, dict]]) -> pd.DataFrame:
+    """
+    按顺序把管理员暂存的修改/删除应用到同一个 DataFrame，
+    由 commit_pending_ops 统一落盘，多次操作只付一次整表写入。
+    每个操作只作用于该 ID 当前的第一行（即编辑表单里显示的那一行）：
+    旧数据里坏 ID 会被统一转成 0，不能一次改掉/删掉所有同 ID 的记录。
+    """
+    df = df.reset_index(drop=True)
+    # ID → 仍存在的行位置（按文件顺序），删除时弹出队首，后续操作自然落到下一条
+    rows_by_id: dict[int, list[int]] = {}
+    for pos, row_id in enumerate(df["ID"].tolist()):
+        rows_by_id.setdefault(row_id, []).append(pos)
+
+    dropped = []
+    for op, row_id, fields in ops:
+        rows = rows_by_id.get(row_id)
+        if not rows:
+            continue
+        if op == "update":
+            # 编辑值都来自表单选项，ensure_schema 已保证它们在 category 类别表里
+            for col, value in fields.items():
+                df.iat[rows[0], df.columns.get_loc(col)] = value
+        elif op == "delete":
+            dropped.append(rows.pop(0))
+    return df.drop(index=dropped).reset_index(drop=True)
+
+
+def build_xlsx_bytes(df: pd.DataFrame) -> bytes:
+    """
+    用 xlsxwriter 导出 Excel（比 openpyxl 构建整本工作簿对象快得多）。
+    不开 constant_memory：pandas 按列写单元格，该模式只接受按行顺序写入，会丢数据。
+    """
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter", engine_kwargs={"options": {"strings_to_urls": False}}) as w:
+        df.to_excel(w, index=False, sheet_name="signups")
+    return buf.getvalue()
+
+
+# 键含筛选结果和文件版本，每次报名都会产生新键；只保留最近几份，旧版本的导出不会一直占内存
+@st.cache_data(show_spinner=False, max_entries=8)
+def export_csv_bytes(row_index: tuple[int, ...], version: tuple[int, int], _df: pd.DataFrame) -> bytes:
+    """
+    下载用 CSV 字节。row_index 是快照数据 _df 中被选中的行标签，
+    同一份数据（文件版本）下标签稳定，可直接作为缓存键。
+    加 BOM（utf-8-sig）是为了让 Excel 正确识别中文。
+    """
+    return _df.loc[list(row_index)].to_csv(index=False).encode("utf-8-sig")
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def export_xlsx_bytes(row_index: tuple[int, ...], version: tuple[int, int], _df: pd.DataFrame) -> bytes:
+    """下载用 Excel 字节，缓存规则同 export_csv_bytes"""
+    return build_xlsx_bytes(_df.loc[list(row_index)])
 
 
 def create_entry(name: str, th: str, fill: str) -> dict:
@@ -215,6 +624,7 @@ st.set_page_config(page_title="联赛报名系统", page_icon="⚔️")
 st.title("🛡️ 联赛报名系统")
 st.markdown("---")
 
+# 本次 rerun 的时间与轮次边界只算一次，下面各区块共用
 now = now_cn()
 current_start, current_end = get_signup_window(now)
 next_start = get_next_signup_start(now)
@@ -225,7 +635,7 @@ st.caption(
 )
 
 # ---- 报名区 ----
-if is_signup_open():
+if is_signup_open(now):
     st.success("🟢 当前报名通道已开启！")
     st.info(
         f"本轮报名截止：**{current_end:%Y-%m-%d %H:%M}**\n\n"
@@ -238,8 +648,8 @@ if is_signup_open():
         name_raw = st.text_input("游戏名字", placeholder="例如：部落唐伯虎")
         name = normalize_name(name_raw)
 
-        townhall = st.selectbox("大本营等级", ["18本", "17本", "16本", "16本以下"])
-        fill_status = st.radio("是否接受补位", ["补位 (服从安排)", "不补位 (必须首发)"])
+        townhall = st.selectbox("大本营等级", TOWNHALL_OPTIONS)
+        fill_status = st.radio("是否接受补位", FILL_OPTIONS)
 
         submitted = st.form_submit_button("立即报名")
 
@@ -251,26 +661,21 @@ if is_signup_open():
                 st.error("❌ 游戏名字太长了（建议 ≤ 24 个字符）。")
                 st.stop()
 
-            df_old = load_data()
-            duplicated = False
-            if not df_old.empty:
-                submit_dt = parse_submit_time_series(df_old)
-                df_old = df_old.assign(提交时间_dt=submit_dt).dropna(subset=["提交时间_dt"])
-                mask_current = df_old["提交时间_dt"].between(current_start, current_end)
-                # 用规范化名字做比对，减少空格/大小写导致的“重复漏洞”
-                old_names = df_old.loc[mask_current, "游戏名字"].astype(str).map(normalize_name)
-                if (old_names == name).any():
-                    duplicated = True
-
-            if duplicated:
-                st.error("❌ 本轮报名中已存在相同的游戏名字，请勿重复提交。")
-            else:
-                try:
+            try:
+                # 本轮名字来自 round_<YYYYMM>.idx，查重不读 CSV，只是一次 set 查找
+                duplicated = name in load_round_names(current_start, current_end)
+
+                if duplicated:
+                    st.error("❌ 本轮报名中已存在相同的游戏名字，请勿重复提交。")
+                else:
                     add_entry(create_entry(name, townhall, fill_status))
                     st.balloons()
                     st.success(f"✅ {name}，报名成功！已记录。")
-                except TimeoutError as e:
-                    st.error(str(e))
+            except TimeoutError as e:
+                st.error(str(e))
+            except (ValueError, OSError):
+                # CSV 解析失败等：宁可暂停报名，也不能在查重失效的情况下放行
+                st.error("❌ 报名数据读取失败，暂时无法报名，请联系管理员检查数据文件。")
 else:
     st.error("🔴 当前不在报名时间内。")
     st.info(
@@ -280,168 +685,208 @@ else:
 
 # ---- 我的报名记录（你要的）----
 st.markdown("---")
-with st.expander("🙋 查看我的报名记录（输入游戏名字）", expanded=True):
-    df_all = load_data()
-    my_name_raw = st.text_input("输入你的游戏名字（会自动忽略前后空格）", key="myname")
-    my_name = normalize_name(my_name_raw)
 
-    if my_name and not df_all.empty:
-        df_all["提交时间_dt"] = parse_submit_time_series(df_all)
-        df_all = df_all.dropna(subset=["提交时间_dt"])
 
-        # 规范化后匹配
-        df_all["游戏名字_norm"] = df_all["游戏名字"].astype(str).map(normalize_name)
-        mine = df_all[df_all["游戏名字_norm"] == my_name].copy()
+# 用 fragment 包住：在这里输入名字只重跑本区块，不重跑报名表、备份与其他区块
+@st.fragment
+def my_records_section():
+    with st.expander("🙋 查看我的报名记录（输入游戏名字）", expanded=True):
+        # 本区块只取一次快照，派生数据都与它对应
+        version, df_all = load_snapshot()
+        my_name_raw = st.text_input("输入你的游戏名字（会自动忽略前后空格）", key="myname")
+        my_name = normalize_name(my_name_raw)
 
-        if mine.empty:
-            st.warning("没有找到你的记录（确认名字是否完全一致）。")
-        else:
-            # 本轮 & 历史
-            mine_current = mine[mine["提交时间_dt"].between(current_start, current_end)].copy()
-            mine_history = mine[~mine.index.isin(mine_current.index)].copy()
+        if my_name and not df_all.empty:
+            # 派生列只作为局部 Series 使用，不改动快照里的表，也不做中间 copy
+            ts = submit_times(version, df_all)
+            # 规范化后匹配
+            mine = ts.notna() & (normalize_series(df_all["游戏名字"]) == my_name)
 
-            st.subheader("📌 我的本轮记录")
-            if mine_current.empty:
-                st.write("本轮暂无记录。")
+            if not mine.any():
+                st.warning("没有找到你的记录（确认名字是否完全一致）。")
             else:
-                st.dataframe(mine_current[COLUMNS], use_container_width=True)
+                # 本轮 & 历史
+                in_round = ts.between(current_start, current_end)
+                mine_current = df_all.loc[mine & in_round]
+                mine_history = df_all.loc[mine & ~in_round]
+
+                st.subheader("📌 我的本轮记录")
+                if mine_current.empty:
+                    st.write("本轮暂无记录。")
+                else:
+                    st.dataframe(mine_current, use_container_width=True)
+
+                st.subheader("🗂 我的历史记录")
+                if mine_history.empty:
+                    st.write("暂无历史记录。")
+                else:
+                    st.dataframe(mine_history, use_container_width=True)
+        else:
+            st.write("在上面输入游戏名字即可查询。")
 
-            st.subheader("🗂 我的历史记录")
-            if mine_history.empty:
-                st.write("暂无历史记录。")
-            else:
-                st.dataframe(mine_history[COLUMNS], use_container_width=True)
-    else:
-        st.write("在上面输入游戏名字即可查询。")
+
+my_records_section()
 
 # ---- 查看/筛选/下载 + 管理员编辑删除 ----
 st.markdown("---")
-with st.expander("📊 查看 / 管理已报名名单（筛选、下载、管理员编辑/删除）"):
-    df = load_data()
 
-    if df.empty:
-        st.write("暂无报名数据。")
-    else:
-        # 用于显示/筛选
-        st.subheader("筛选 / 搜索（查）")
-
-        levels = sorted(df["大本营等级"].dropna().unique().tolist())
-        level_selected = st.multiselect("按大本营等级筛选", options=levels, default=levels)
-
-        fills = sorted(df["是否接受补位"].dropna().unique().tolist())
-        fill_selected = st.multiselect("按补位意向筛选", options=fills, default=fills)
-
-        name_keyword = st.text_input("按游戏名字搜索（支持模糊匹配）", key="search_name")
-
-        df_display = df.copy()
-        if level_selected:
-            df_display = df_display[df_display["大本营等级"].isin(level_selected)]
-        if fill_selected:
-            df_display = df_display[df_display["是否接受补位"].isin(fill_selected)]
-        if name_keyword:
-            df_display = df_display[
-                df_display["游戏名字"].astype(str).str.contains(name_keyword, case=False, na=False)
-            ]
-
-        st.dataframe(df_display, use_container_width=True)
-        st.caption(f"当前总报名人数：{len(df)} 人（筛选后显示 {len(df_display)} 人）")
-
-        # 下载 CSV/Excel（筛选结果）
-        st.subheader("下载（筛选结果）")
-        csv_bytes = df_display.to_csv(index=False).encode("utf-8-sig")
-        st.download_button(
-            "📥 下载 CSV",
-            csv_bytes,
-            "signup_list_filtered.csv",
-            "text/csv",
-            key="download-csv",
-        )
 
-        excel_buffer = io.BytesIO()
-        df_display.to_excel(excel_buffer, index=False)
-        excel_buffer.seek(0)
-        st.download_button(
-            "📥 下载 Excel",
-            excel_buffer,
-            "signup_list_filtered.xlsx",
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key="download-excel",
-        )
+# 同上：筛选、搜索、下载只重跑本区块；需要刷新全页时用 st.rerun()（默认作用于整个应用）
+@st.fragment
+def admin_section():
+    with st.expander("📊 查看 / 管理已报名名单（筛选、下载、管理员编辑/删除）"):
+        # 本区块只取一次快照，搜索、导出、按 ID 取行都用这一版本和这份数据
+        version, df = load_snapshot()
 
-        st.markdown("---")
-        st.subheader("管理员操作（强制关闭 / 修改 / 删除）")
-
-        pwd = st.text_input("输入管理员密码以进行编辑：", type="password", key="admin_pwd")
-        if pwd == ADMIN_PASSWORD:
-            st.success("✅ 管理员验证通过。")
-
-            # 强制关闭开关
-            colA, colB = st.columns(2)
-            with colA:
-                if os.path.exists(FORCE_CLOSE_FILE):
-                    if st.button("▶️ 恢复报名通道"):
-                        os.remove(FORCE_CLOSE_FILE)
-                        st.success("报名通道已恢复。")
-                        st.experimental_rerun()
+        if df.empty:
+            st.write("暂无报名数据。")
+        else:
+            # 用于显示/筛选
+            st.subheader("筛选 / 搜索（查）")
+
+            # category 列的类别表即选项列表（表单选项 + 历史取值），直接读属性，无需逐行 unique + sort
+            levels = df["大本营等级"].cat.categories.tolist()
+            level_selected = st.multiselect("按大本营等级筛选", options=levels, default=levels)
+
+            fills = df["是否接受补位"].cat.categories.tolist()
+            fill_selected = st.multiselect("按补位意向筛选", options=fills, default=fills)
+
+            name_keyword = st.text_input("按游戏名字搜索（支持模糊匹配）", key="search_name")
+
+            # 三个条件合成一个布尔掩码，只切片一次
+            mask = np.ones(len(df), dtype=bool)
+            if level_selected:
+                mask &= df["大本营等级"].isin(level_selected).to_numpy()
+            if fill_selected:
+                mask &= df["是否接受补位"].isin(fill_selected).to_numpy()
+            if name_keyword:
+                # 预先小写化的名字数组按文件版本缓存；按子串匹配（关键字不再被当成正则）
+                mask &= np.char.find(lower_names(version, df), name_keyword.lower()) >= 0
+            df_display = df[mask]
+
+            st.dataframe(df_display, use_container_width=True)
+            st.caption(f"当前总报名人数：{len(df)} 人（筛选后显示 {len(df_display)} 人）")
+
+            # 下载 CSV/Excel（筛选结果）
+            st.subheader("下载（筛选结果）")
+            # 导出内容按 (筛选后的行, 文件版本) 缓存，筛选条件不变时不再重复序列化
+            row_index = tuple(df_display.index)
+            st.download_button(
+                "📥 下载 CSV",
+                export_csv_bytes(row_index, version, df),
+                "signup_list_filtered.csv",
+                "text/csv",
+                key="download-csv",
+            )
+
+            # Excel 序列化最贵：勾选后才生成，平时筛选/输入不为它付出任何代价
+            if st.checkbox("生成 Excel 下载文件", key="prepare-excel"):
+                st.download_button(
+                    "📥 下载 Excel",
+                    export_xlsx_bytes(row_index, version, df),
+                    "signup_list_filtered.xlsx",
+                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key="download-excel",
+                )
+
+            st.markdown("---")
+            st.subheader("管理员操作（强制关闭 / 修改 / 删除）")
+
+            pwd = st.text_input("输入管理员密码以进行编辑：", type="password", key="admin_pwd")
+            if is_admin(pwd):
+                st.success("✅ 管理员验证通过。")
+
+                # 强制关闭开关
+                colA, colB = st.columns(2)
+                with colA:
+                    if os.path.exists(FORCE_CLOSE_FILE):
+                        if st.button("▶️ 恢复报名通道"):
+                            os.remove(FORCE_CLOSE_FILE)
+                            st.success("报名通道已恢复。")
+                            st.rerun()
+                    else:
+                        if st.button("⛔ 强制关闭报名通道"):
+                            open(FORCE_CLOSE_FILE, "w").close()
+                            st.warning("报名通道已强制关闭。")
+                            st.rerun()
+
+                with colB:
+                    st.write("（强制关闭仅影响“是否开放报名”，不影响数据查看与下载）")
+
+                # 编辑/删除（对全量数据操作）
+                id_options = df_display["ID"].tolist()
+                if not id_options:
+                    st.info("当前筛选结果为空，无法编辑。")
                 else:
-                    if st.button("⛔ 强制关闭报名通道"):
-                        open(FORCE_CLOSE_FILE, "w").close()
-                        st.warning("报名通道已强制关闭。")
-                        st.experimental_rerun()
-
-            with colB:
-                st.write("（强制关闭仅影响“是否开放报名”，不影响数据查看与下载）")
-
-            # 编辑/删除（对全量数据操作）
-            id_options = df_display["ID"].tolist()
-            if not id_options:
-                st.info("当前筛选结果为空，无法编辑。")
-            else:
-                selected_id = st.selectbox("选择要修改 / 删除的报名 ID", id_options)
-
-                full_df = load_data()
-                row = full_df[full_df["ID"] == selected_id].iloc[0]
-
-                with st.form("edit_delete_form"):
-                    st.write(f"当前编辑的记录 ID：**{selected_id}**")
-
-                    edit_name = st.text_input("游戏名字（修改）", value=str(row["游戏名字"]))
-                    edit_name = normalize_name(edit_name)
+                    selected_id = st.selectbox("选择要修改 / 删除的报名 ID", id_options)
 
-                    townhall_options = ["18本", "17本", "16本", "16本以下"]
-                    th_index = townhall_options.index(row["大本营等级"]) if row["大本营等级"] in townhall_options else 0
-                    edit_townhall = st.selectbox("大本营等级（修改）", townhall_options, index=th_index)
+                    row = records_by_id(version, df).get(selected_id)
+                    if row is None:
+                        st.error("未在全量数据中找到该 ID，可能数据已更新，请刷新页面。")
+                        st.stop()
+
+                    with st.form("edit_delete_form"):
+                        st.write(f"当前编辑的记录 ID：**{selected_id}**")
+
+                        edit_name = st.text_input("游戏名字（修改）", value=str(row["游戏名字"]))
+                        edit_name = normalize_name(edit_name)
+
+                        th_index = TOWNHALL_IDX.get(row["大本营等级"], 0)
+                        edit_townhall = st.selectbox("大本营等级（修改）", TOWNHALL_OPTIONS, index=th_index)
+
+                        fill_index = FILL_IDX.get(row["是否接受补位"], 0)
+                        edit_fill = st.radio("是否接受补位（修改）", FILL_OPTIONS, index=fill_index)
+
+                        col1, col2 = st.columns(2)
+                        save_btn = col1.form_submit_button("💾 保存修改")
+                        delete_btn = col2.form_submit_button("🗑 删除该报名")
+
+                    pending_ops = st.session_state.setdefault("pending_ops", [])
+
+                    if save_btn or delete_btn:
+                        if selected_id not in records_by_id(version, df):
+                            st.error("未在全量数据中找到该 ID，可能数据已更新，请刷新页面。")
+                        else:
+                            # 只暂存，不立即重写整表；统一由“提交全部修改”一次落盘
+                            if save_btn:
+                                if not edit_name:
+                                    st.error("游戏名字不能为空。")
+                                    st.stop()
+                                pending_ops.append((
+                                    "update",
+                                    int(selected_id),
+                                    {"游戏名字": edit_name, "大本营等级": edit_townhall, "是否接受补位": edit_fill},
+                                ))
+                                st.info(f"📝 已暂存对 ID {selected_id} 的修改。")
+
+                            if delete_btn:
+                                pending_ops.append(("delete", int(selected_id), {}))
+                                st.info(f"📝 已暂存删除 ID {selected_id}。")
+
+                    if pending_ops:
+                        st.write(f"待提交的修改：**{len(pending_ops)}** 项（提交前不会写入数据文件）")
+                        for op, op_id, fields in pending_ops:
+                            if op == "update":
+                                st.write(f"- 修改 ID {op_id}：{fields['游戏名字']} / {fields['大本营等级']} / {fields['是否接受补位']}")
+                            else:
+                                st.write(f"- 删除 ID {op_id}")
+
+                        col3, col4 = st.columns(2)
+                        if col3.button("💾 提交全部修改"):
+                            try:
+                                commit_pending_ops(pending_ops)
+                            except TimeoutError as e:
+                                st.error(str(e))
+                                st.stop()
+                            pending_ops.clear()
+                            st.success("✅ 全部修改已保存。")
+                            st.rerun()
+                        if col4.button("↩️ 放弃全部修改"):
+                            pending_ops.clear()
+                            st.rerun()
 
-                    fill_options = ["补位 (服从安排)", "不补位 (必须首发)"]
-                    fill_index = fill_options.index(row["是否接受补位"]) if row["是否接受补位"] in fill_options else 0
-                    edit_fill = st.radio("是否接受补位（修改）", fill_options, index=fill_index)
+            elif pwd:
+                st.error("❌ 管理员密码错误。")
 
-                    col1, col2 = st.columns(2)
-                    save_btn = col1.form_submit_button("💾 保存修改")
-                    delete_btn = col2.form_submit_button("🗑 删除该报名")
 
-                if save_btn or delete_btn:
-                    full_df = load_data()
-                    if selected_id not in full_df["ID"].values:
-                        st.error("未在全量数据中找到该 ID，可能数据已更新，请刷新页面。")
-                    else:
-                        if save_btn:
-                            if not edit_name:
-                                st.error("游戏名字不能为空。")
-                                st.stop()
-                            idx = full_df[full_df["ID"] == selected_id].index[0]
-                            full_df.at[idx, "游戏名字"] = edit_name
-                            full_df.at[idx, "大本营等级"] = edit_townhall
-                            full_df.at[idx, "是否接受补位"] = edit_fill
-                            save_full_data(full_df)
-                            st.success("✅ 修改已保存。")
-                            st.experimental_rerun()
-
-                        if delete_btn:
-                            full_df = full_df[full_df["ID"] != selected_id]
-                            save_full_data(full_df)
-                            st.success("🗑 已删除该报名记录。")
-                            st.experimental_rerun()
-
-        elif pwd:
-            st.error("❌ 管理员密码错误。")
+admin_section()